@@ -0,0 +1,66 @@
+import logging
+import math
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, BufferedInputFile
+
+from app.config import ADMIN_USER_IDS, PROFILE_MAX_SECONDS
+from app.services import profiler, task_parser
+from app.services.weeek_service import get_weeek_pool_metrics
+
+router = Router()
+router.message.filter(F.from_user.id.in_(ADMIN_USER_IDS))
+
+
+@router.message(Command(commands=["profile"]))
+async def handle_profile(message: Message, command: CommandObject):
+    """Запускает сэмплирующий профайлер на N секунд и присылает результаты файлами."""
+    try:
+        seconds = float(command.args) if command.args else 10.0
+    except ValueError:
+        seconds = math.nan
+    if not math.isfinite(seconds):
+        await message.answer("Использование: /profile &lt;секунды&gt;")
+        return
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+
+    await message.answer(f"Профилирую {seconds:g} с...")
+    try:
+        result = await profiler.run_profile(seconds)
+    except RuntimeError:
+        await message.answer("Профилирование уже запущено, дождитесь результата.")
+        return
+    except Exception as e:
+        logging.error(f"Ошибка в handle_profile: {e}", exc_info=True)
+        await message.answer("Не удалось снять профиль.")
+        return
+
+    await message.answer_document(
+        BufferedInputFile(result["collapsed"].encode(), filename="profile.collapsed.txt"),
+        caption=f"Collapsed stacks для flamegraph, сэмплов: {result['samples']}"
+    )
+    await message.answer_document(BufferedInputFile(result["summary"].encode(), filename="profile.summary.txt"))
+    await message.answer_document(BufferedInputFile(result["tasks"].encode(), filename="asyncio.tasks.txt"))
+
+
+@router.message(Command(commands=["stats"]))
+async def handle_stats(message: Message):
+    """Показывает метрики парсера задач и клиентов Weeek по тенантам."""
+    parser_metrics = task_parser.get_parser_metrics()
+    lines = [
+        "<b>Парсер задач</b>",
+        f"Запросов: {parser_metrics['requests']}, неудачных: {parser_metrics['failures']} "
+        f"({parser_metrics['failure_rate']:.1%}), частичных: {parser_metrics['partial']}",
+        f"Токены: prompt {parser_metrics['prompt_tokens']}, completion {parser_metrics['completion_tokens']}",
+        f"Первое поле: {parser_metrics['avg_first_field_seconds']:.2f} с, весь ответ: {parser_metrics['avg_total_seconds']:.2f} с",
+        "",
+        "<b>Weeek</b>",
+    ]
+    for tenant, metrics in get_weeek_pool_metrics().items():
+        lines.append(
+            f"{tenant}: запросов {metrics['requests']:.0f}, ошибок {metrics['errors']:.0f}, "
+            f"кэш {metrics['cache_hits']:.0f}/{metrics['cache_hits'] + metrics['cache_misses']:.0f}, "
+            f"общих запросов {metrics['inflight_joins']:.0f}, "
+            f"ожидание лимита {metrics['rate_limit_wait_total']:.1f} с"
+        )
+    await message.answer("\n".join(lines))
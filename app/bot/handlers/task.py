@@ -1,3 +1,5 @@
+import asyncio
+import html
 import logging
 import os
 from aiogram import Router, F, Bot
@@ -9,11 +11,13 @@ from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, C
 from typing import List, Dict, Any, Optional
 
 from app.services import task_parser
-from app.services.weeek_service import create_weeek_task, _weeek_client
-from app.services.task_parser import client as openai_client
+from app.services.weeek_service import create_weeek_task, get_weeek_client, build_task_url, TenantNotConfigured
+from app.services.task_dedup import get_similarity_index, dedup_scope
 
 router = Router()
 
+CHAT_NOT_LINKED_MESSAGE = "Этот чат не привязан к рабочему пространству Weeek. Обратитесь к администратору бота."
+
 
 # Определяем состояния для нашего агента
 class TaskCreation(StatesGroup):
@@ -22,6 +26,7 @@ class TaskCreation(StatesGroup):
     AwaitingProjectSelection = State()
     AwaitingBoardSelection = State()
     AwaitingAssigneeSelection = State()
+    AwaitingDuplicateConfirmation = State()
 
 
 async def find_assignee_by_name(assignee_name_input: str, members: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -96,7 +101,6 @@ async def find_assignee_by_name(assignee_name_input: str, members: List[Dict[str
 async def create_task_from_state(message: Message, state: FSMContext):
     """Собирает все данные из состояния и создает задачу."""
     data = await state.get_data()
-    await state.clear()
 
     title = data.get("title")
     deadline = data.get("deadline")
@@ -105,9 +109,42 @@ async def create_task_from_state(message: Message, state: FSMContext):
     board_id = data.get("board_id")
     
     if project_id is None or board_id is None:
+        await state.clear()
         await message.answer("Не удалось определить проект или доску для задачи. Пожалуйста, попробуйте еще раз.")
         return
 
+    # Перед созданием проверяем, нет ли на этой доске недавно созданной похожей задачи.
+    # Проверка вспомогательная: если она сломалась, задачу все равно создаем
+    scope = None
+    similar_tasks = []
+    similarity_index = get_similarity_index()
+    try:
+        scope = dedup_scope(get_weeek_client(message.chat.id).tenant, project_id, board_id)
+        await similarity_index.ensure_loaded()
+        if not data.get("skip_duplicate_check"):
+            similar_tasks = similarity_index.find_similar(scope, title)
+    except Exception as e:
+        logging.error(f"Проверка на дубликаты не удалась, создаю задачу без нее: {e}", exc_info=True)
+        scope = None
+
+    if similar_tasks:
+        lines = []
+        for task in similar_tasks:
+            task_title = html.escape(task["title"])
+            lines.append(f"• <a href=\"{html.escape(task['url'], quote=True)}\">{task_title}</a>" if task["url"] else f"• {task_title} (ID: {task['task_id']})")
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Все равно создать", callback_data="duplicate_create")],
+            [InlineKeyboardButton(text="Отмена", callback_data="duplicate_cancel")],
+        ])
+        await message.answer(
+            "⚠️ Похожая задача уже есть:\n" + "\n".join(lines) + "\n\nСоздать новую задачу все равно?",
+            reply_markup=keyboard
+        )
+        await state.set_state(TaskCreation.AwaitingDuplicateConfirmation)
+        return
+
+    await state.clear()
+
     await message.answer(
         f"Отлично, все данные собраны:\n"
         f"<b>Название:</b> {title}\n"
@@ -125,10 +162,18 @@ async def create_task_from_state(message: Message, state: FSMContext):
             deadline=deadline,
             assignee_id=assignee_id,
             project_id=project_id,
-            board_id=board_id
+            board_id=board_id,
+            chat_id=message.chat.id
         )
         if result.get("status") == "success":
+            task_id = result.get("task_id")
             await message.answer(f"✅ Задача «{title}» успешно создана!")
+            if scope is not None:
+                try:
+                    similarity_index.add(scope, title, task_id=task_id, url=build_task_url(task_id))
+                    await similarity_index.save_if_needed()
+                except Exception as e:
+                    logging.error(f"Не удалось добавить задачу в индекс дубликатов: {e}", exc_info=True)
         else:
             await message.answer(f"❌ Произошла ошибка при создании задачи в Weeek: {result.get('message', 'Неизвестная ошибка')}")
     except Exception as e:
@@ -136,13 +181,39 @@ async def create_task_from_state(message: Message, state: FSMContext):
         await message.answer("Упс, что-то пошло не так. Попробуйте еще раз.")
 
 
+def _log_prefetch_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f"Weeek metadata prefetch failed: {task.exception()}")
+
+
 async def process_task_text(text: str, message: Message, bot: Bot, state: FSMContext):
     """Анализирует текст, начинает диалог, если нужно, или сразу создает задачу."""
+    # Новая задача: данные прошлой (проект, доска, ответственный, ожидание подтверждения дубликата)
+    # не должны попасть в нее ни из текстового, ни из голосового сообщения
+    await state.clear()
+    try:
+        # Чат без рабочего пространства отсекаем до запроса к LLM
+        weeek_client = get_weeek_client(message.chat.id)
+    except TenantNotConfigured:
+        await message.answer(CHAT_NOT_LINKED_MESSAGE)
+        return
     await bot.send_chat_action(chat_id=message.chat.id, action=ChatAction.TYPING)
     
     try:
         logging.debug(f"process_task_text: Input text: {text}")
-        parsed_data = await task_parser.parse_task_text(text)
+        prefetch_tasks = []
+
+        async def on_field(name: str, value: Any):
+            if not prefetch_tasks:
+                # Участники и проекты понадобятся почти всегда — грузим их в кэш, пока модель дописывает ответ
+                for coro in (weeek_client.get_workspace_members(), weeek_client.get_projects()):
+                    prefetch_task = asyncio.create_task(coro)
+                    prefetch_task.add_done_callback(_log_prefetch_error)
+                    prefetch_tasks.append(prefetch_task)
+            if name == "title" and value:
+                await message.answer(f"📝 <b>Задача:</b> {html.escape(str(value))}")
+
+        parsed_data = await task_parser.parse_task_text(text, on_field=on_field)
         logging.debug(f"process_task_text: Parsed data from task_parser: {parsed_data}")
 
         title = parsed_data.get("title")
@@ -190,6 +261,7 @@ async def process_task_text(text: str, message: Message, bot: Bot, state: FSMCon
 async def check_and_ask_for_missing_info(message: Message, state: FSMContext):
     """Проверяет, какие данные отсутствуют, и запрашивает их у пользователя."""
     data = await state.get_data()
+    weeek_client = get_weeek_client(message.chat.id)
     
     # 1. Проверяем дедлайн
     if not data.get("deadline"):
@@ -199,7 +271,7 @@ async def check_and_ask_for_missing_info(message: Message, state: FSMContext):
 
     # 2. Проверяем ответственного
     if not data.get("assignee_id"): # Если ID ответственного еще нет
-        members_response = await _weeek_client.get_workspace_members()
+        members_response = await weeek_client.get_workspace_members()
         members = members_response.get("members", [])
         
         if not members:
@@ -239,7 +311,7 @@ async def check_and_ask_for_missing_info(message: Message, state: FSMContext):
     
     # 3. Проверяем проект
     if not data.get("project_id"):
-        projects_response = await _weeek_client.get_projects()
+        projects_response = await weeek_client.get_projects()
         projects = projects_response.get("projects", [])
         
         if not projects:
@@ -273,7 +345,7 @@ async def check_and_ask_for_missing_info(message: Message, state: FSMContext):
 
     # 4. Проверяем доску
     if not data.get("board_id"):
-        projects_response = await _weeek_client.get_projects() # Получаем проекты снова, чтобы найти название проекта по ID
+        projects_response = await weeek_client.get_projects() # Получаем проекты снова, чтобы найти название проекта по ID
         projects = projects_response.get("projects", [])
         current_project_name = "Неизвестный проект"
         for p in projects:
@@ -281,7 +353,7 @@ async def check_and_ask_for_missing_info(message: Message, state: FSMContext):
                 current_project_name = p["title"]
                 break
 
-        boards_response = await _weeek_client.get_boards(project_id=data["project_id"])
+        boards_response = await weeek_client.get_boards(project_id=data["project_id"])
         boards = boards_response.get("boards", [])
 
         if not boards:
@@ -339,10 +411,12 @@ async def handle_deadline(message: Message, state: FSMContext):
 
 
 @router.message(TaskCreation.AwaitingAssignee)
+@router.message(TaskCreation.AwaitingAssigneeSelection, F.text) # Текст во время выбора ответственного обрабатываем как ввод имени
 async def handle_assignee_text(message: Message, state: FSMContext):
     """Обрабатывает текстовый ответ пользователя про ответственного."""
     assignee_name_input = message.text
-    members_response = await _weeek_client.get_workspace_members()
+    weeek_client = get_weeek_client(message.chat.id)
+    members_response = await weeek_client.get_workspace_members()
     members = members_response.get("members", [])
     
     if not members:
@@ -376,9 +450,10 @@ async def handle_assignee_text(message: Message, state: FSMContext):
 async def handle_project_selection(callback_query: CallbackQuery, state: FSMContext):
     project_id = int(callback_query.data.split("_")[2])
     await state.update_data(project_id=project_id)
+    weeek_client = get_weeek_client(callback_query.message.chat.id)
     
     # Получаем название проекта для отображения
-    projects_response = await _weeek_client.get_projects()
+    projects_response = await weeek_client.get_projects()
     projects = projects_response.get("projects", [])
     selected_project_name = "Неизвестный проект"
     for p in projects:
@@ -387,7 +462,7 @@ async def handle_project_selection(callback_query: CallbackQuery, state: FSMCont
             break
 
     # Получаем доски для выбранного проекта
-    boards_response = await _weeek_client.get_boards(project_id=project_id)
+    boards_response = await weeek_client.get_boards(project_id=project_id)
     boards = boards_response.get("boards", [])
 
     if not boards:
@@ -421,7 +496,8 @@ async def handle_board_selection(callback_query: CallbackQuery, state: FSMContex
     project_id = data.get("project_id")
     selected_board_name = "Неизвестная доска"
     if project_id:
-        boards_response = await _weeek_client.get_boards(project_id=project_id)
+        weeek_client = get_weeek_client(callback_query.message.chat.id)
+        boards_response = await weeek_client.get_boards(project_id=project_id)
         boards = boards_response.get("boards", [])
         for b in boards:
             if b["id"] == board_id:
@@ -438,9 +514,10 @@ async def handle_board_selection(callback_query: CallbackQuery, state: FSMContex
 async def handle_assignee_selection(callback_query: CallbackQuery, state: FSMContext):
     assignee_id = callback_query.data.split("_")[2]
     await state.update_data(assignee_id=assignee_id)
+    weeek_client = get_weeek_client(callback_query.message.chat.id)
     
     # Получаем имя выбранного ответственного для отображения
-    members_response = await _weeek_client.get_workspace_members()
+    members_response = await weeek_client.get_workspace_members()
     members = members_response.get("members", [])
     selected_member_name = "Неизвестный"
     for member in members:
@@ -453,29 +530,46 @@ async def handle_assignee_selection(callback_query: CallbackQuery, state: FSMCon
     await check_and_ask_for_missing_info(callback_query.message, state)
 
 
-@router.message(F.text)
+@router.callback_query(F.data == "duplicate_create", TaskCreation.AwaitingDuplicateConfirmation)
+async def handle_duplicate_create(callback_query: CallbackQuery, state: FSMContext):
+    await state.update_data(skip_duplicate_check=True)
+    await callback_query.message.edit_reply_markup(reply_markup=None)
+    await callback_query.answer()
+    await create_task_from_state(callback_query.message, state)
+
+
+@router.callback_query(F.data == "duplicate_cancel", TaskCreation.AwaitingDuplicateConfirmation)
+async def handle_duplicate_cancel(callback_query: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await callback_query.message.edit_text("Создание задачи отменено.")
+    await callback_query.answer()
+
+
+# Ответы в диалоге (дедлайн, ответственный) обрабатываются хендлерами состояний выше и в
+# планировщик не попадают; сюда доходит только текст новой задачи, который уходит в LLM
+@router.message(F.text, flags={"expensive": True})
 async def handle_text_message(message: Message, bot: Bot, state: FSMContext):
     """Обработчик для текстовых сообщений (точка входа)."""
-    current_state = await state.get_state()
-    if current_state == TaskCreation.AwaitingDeadline:
-        await handle_deadline(message, state)
-    elif current_state == TaskCreation.AwaitingAssignee:
-        await handle_assignee_text(message, state)
-    elif current_state == TaskCreation.AwaitingAssigneeSelection: # Если пользователь ввел текст во время выбора ответственного
-        await handle_assignee_text(message, state) # Повторно обрабатываем как текстовый ввод
-    else:
-        await process_task_text(message.text, message, bot, state)
+    await process_task_text(message.text, message, bot, state)
 
 
-@router.message(F.voice)
+@router.message(F.voice, flags={"expensive": True})
 async def handle_voice_message(message: Message, bot: Bot, state: FSMContext):
     """Обработчик для голосовых сообщений (точка входа)."""
+    try:
+        get_weeek_client(message.chat.id)
+    except TenantNotConfigured:
+        await message.answer(CHAT_NOT_LINKED_MESSAGE)
+        return
     await bot.send_chat_action(chat_id=message.chat.id, action=ChatAction.RECORD_VOICE)
     ogg_filename = f"{message.voice.file_id}.ogg"
     try:
         await bot.download(message.voice, destination=ogg_filename)
+        # Асинхронный клиент: синхронный вызов Whisper остановил бы event loop для всех пользователей
         with open(ogg_filename, "rb") as audio_file:
-            transcript = openai_client.audio.transcriptions.create(model="whisper-1", file=audio_file)
+            transcript = await task_parser.get_async_openai_client().audio.transcriptions.create(
+                model="whisper-1", file=audio_file
+            )
         
         text = transcript.text.strip()
         if not text:
@@ -0,0 +1,49 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message, TelegramObject
+
+from app.services.admission import AdmissionRejected, FairScheduler
+
+BUSY_MESSAGE = "⏳ Я еще обрабатываю ваши предыдущие запросы. Подождите немного и попробуйте снова."
+QUEUED_MESSAGE = "⏳ Запрос в очереди, скоро возьмусь за него."
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    """
+    Пропускает хендлеры с флагом `expensive` через FairScheduler.
+    Если слот сразу не выдается, пользователь получает быстрый ответ
+    «в очереди» или «занято», а не молчание.
+
+    Ключ планировщика — пользователь, а не чат: в групповом чате один
+    пользователь, заваливающий бота голосовыми, не должен исчерпать лимит за
+    всех участников группы. В личных чатах пользователь и чат совпадают.
+    """
+    def __init__(self, scheduler: FairScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not get_flag(data, "expensive") or not isinstance(event, Message) or event.from_user is None:
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        if not self.scheduler.can_start_now(user_id):
+            if self.scheduler.queued(user_id) >= self.scheduler.max_queued_per_key:
+                logging.info(f"Admission rejected for user {user_id}: too many requests in flight")
+                await event.answer(BUSY_MESSAGE)
+                return None
+            await event.answer(QUEUED_MESSAGE)
+
+        try:
+            async with self.scheduler.slot(user_id):
+                return await handler(event, data)
+        except AdmissionRejected:
+            await event.answer(BUSY_MESSAGE)
+            return None
@@ -1,9 +1,83 @@
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+class ConfigError(ValueError):
+    """Обязательные настройки не заданы или заданы неверно."""
+
+
+# Ошибки разбора переменных окружения. Импорт конфига не падает на кривом значении:
+# подставляется значение по умолчанию, а ошибка сообщается через AppContainer.validate()
+CONFIG_ERRORS = []
+
+
+def _parse_env(name, default, parser):
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        return parser(raw)
+    except (ValueError, TypeError, AttributeError) as e:  # json.JSONDecodeError — подкласс ValueError
+        CONFIG_ERRORS.append(f"{name} is invalid: {e}")
+        return default
+
+
+def _parse_tenants(raw):
+    tenants = json.loads(raw)
+    if not isinstance(tenants, dict):
+        raise ValueError("expected a JSON object")
+    for name, tenant in tenants.items():
+        if not isinstance(tenant, dict):
+            raise ValueError(f"tenant '{name}' must be an object")
+        tenant["chats"] = [int(chat_id) for chat_id in tenant.get("chats", [])]
+    return tenants
+
+
+def _parse_weights(raw):
+    return {int(key): int(value) for key, value in json.loads(raw).items()}
+
+
+def _parse_ids(raw):
+    return {int(user_id) for user_id in raw.split(",") if user_id.strip()}
+
+
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WEEEK_API_TOKEN = os.getenv("WEEEK_API_TOKEN")
 WEEEK_API_BASE_URL = os.getenv("WEEEK_API_BASE_URL", "https://api.weeek.net/public/v1")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Несколько рабочих пространств Weeek в одном боте.
+# Формат: {"team-a": {"token": "...", "chats": [-100123, 456]}, ...}
+# Чаты, не указанные ни в одном тенанте, обслуживаются через WEEEK_API_TOKEN.
+WEEEK_TENANTS = _parse_env("WEEEK_TENANTS", {}, _parse_tenants)
+WEEEK_TENANT_POOL_SIZE = _parse_env("WEEEK_TENANT_POOL_SIZE", 16, int)
+WEEEK_TENANT_RATE_LIMIT = _parse_env("WEEEK_TENANT_RATE_LIMIT", 5.0, float)
+WEEEK_TENANT_RATE_BURST = _parse_env("WEEEK_TENANT_RATE_BURST", 10, int)
+WEEEK_METADATA_CACHE_TTL = _parse_env("WEEEK_METADATA_CACHE_TTL", 300.0, float)
+
+# Администраторы бота (через запятую) — им доступны служебные команды вроде /profile
+ADMIN_USER_IDS = _parse_env("ADMIN_USER_IDS", set(), _parse_ids)
+PROFILE_MAX_SECONDS = _parse_env("PROFILE_MAX_SECONDS", 60.0, float)
+# HTTP-эндпоинт профилирования включается, только если задан порт; токен обязателен
+PROFILER_HTTP_HOST = os.getenv("PROFILER_HTTP_HOST") or "127.0.0.1"
+PROFILER_HTTP_PORT = _parse_env("PROFILER_HTTP_PORT", 0, int)
+PROFILER_HTTP_TOKEN = os.getenv("PROFILER_HTTP_TOKEN")
+
+# Ограничение тяжелых операций (голосовые, Whisper, разбор через LLM)
+ADMISSION_GLOBAL_LIMIT = _parse_env("ADMISSION_GLOBAL_LIMIT", 8, int)
+ADMISSION_PER_USER_LIMIT = _parse_env("ADMISSION_PER_USER_LIMIT", 1, int)
+ADMISSION_MAX_QUEUED_PER_USER = _parse_env("ADMISSION_MAX_QUEUED_PER_USER", 2, int)
+# Веса пользователей для взвешенного round-robin, формат: {"<user_id>": 3}.
+# Вес умножает и долю слотов за проход, и лимит одновременных операций пользователя
+ADMISSION_WEIGHTS = _parse_env("ADMISSION_WEIGHTS", {}, _parse_weights)
+
+# Индекс недавно созданных задач для предупреждения о дубликатах
+DEDUP_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH") or "task_index.json"
+DEDUP_MAX_ITEMS = _parse_env("DEDUP_MAX_ITEMS", 10000, int)
+DEDUP_TTL_SECONDS = _parse_env("DEDUP_TTL_SECONDS", 30 * 24 * 3600.0, float)
+DEDUP_THRESHOLD = _parse_env("DEDUP_THRESHOLD", 0.6, float)
+# Шаблон ссылки на задачу, например https://app.weeek.net/ws/<id>/task/{task_id}; пусто — без ссылки
+WEEEK_TASK_URL_TEMPLATE = os.getenv("WEEEK_TASK_URL_TEMPLATE")
@@ -0,0 +1,89 @@
+from typing import List, Optional
+
+from app import config
+
+
+class AppContainer:
+    """
+    Контейнер сервисов приложения.
+
+    Клиенты OpenAI и Weeek, индекс похожих задач создаются при первом обращении,
+    а не при импорте модулей: импорт хендлеров не тянет за собой openai, а
+    сервисы, до которых дело не дошло, не создаются вовсе.
+    """
+    def __init__(self):
+        self._async_openai_client = None
+        self._weeek_pool = None
+        self._similarity_index = None
+
+    def validate(self) -> None:
+        """Проверяет конфигурацию до запуска бота; бросает ConfigError со списком проблем."""
+        problems: List[str] = list(config.CONFIG_ERRORS)
+        if not config.TELEGRAM_BOT_TOKEN:
+            problems.append("TELEGRAM_BOT_TOKEN is not set")
+        if not config.OPENAI_API_KEY:
+            problems.append("OPENAI_API_KEY is not set")
+        if not config.WEEEK_API_TOKEN and not config.WEEEK_TENANTS:
+            problems.append("WEEEK_API_TOKEN or WEEEK_TENANTS must be set")
+        for name, tenant in config.WEEEK_TENANTS.items():
+            if not isinstance(tenant, dict) or not tenant.get("token"):
+                problems.append(f"WEEEK_TENANTS['{name}'] has no token")
+        if config.PROFILER_HTTP_PORT and not config.PROFILER_HTTP_TOKEN:
+            problems.append("PROFILER_HTTP_TOKEN must be set when PROFILER_HTTP_PORT is enabled")
+        if problems:
+            raise config.ConfigError("; ".join(problems))
+
+    @property
+    def async_openai_client(self):
+        if self._async_openai_client is None:
+            from openai import AsyncOpenAI
+            self._async_openai_client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+        return self._async_openai_client
+
+    @property
+    def weeek_pool(self):
+        if self._weeek_pool is None:
+            from app.services.weeek_service import WeeekClientPool
+            self._weeek_pool = WeeekClientPool(
+                base_url=config.WEEEK_API_BASE_URL,
+                default_token=config.WEEEK_API_TOKEN,
+                tenants=config.WEEEK_TENANTS,
+                max_size=config.WEEEK_TENANT_POOL_SIZE,
+                rate_limit=config.WEEEK_TENANT_RATE_LIMIT,
+                rate_burst=config.WEEEK_TENANT_RATE_BURST,
+                cache_ttl=config.WEEEK_METADATA_CACHE_TTL,
+            )
+        return self._weeek_pool
+
+    @property
+    def similarity_index(self):
+        if self._similarity_index is None:
+            from app.services.task_dedup import TaskSimilarityIndex
+            self._similarity_index = TaskSimilarityIndex(
+                path=config.DEDUP_INDEX_PATH or None,
+                max_items=config.DEDUP_MAX_ITEMS,
+                ttl_seconds=config.DEDUP_TTL_SECONDS,
+                threshold=config.DEDUP_THRESHOLD,
+            )
+        return self._similarity_index
+
+    def shutdown(self) -> None:
+        """Сохраняет состояние созданных сервисов; несозданные не трогает."""
+        if self._similarity_index is not None:
+            self._similarity_index.save()
+
+
+_container: Optional[AppContainer] = None
+
+
+def init_container(container: AppContainer) -> None:
+    global _container
+    _container = container
+
+
+def get_container() -> AppContainer:
+    """Текущий контейнер; если main.py его не создал (скрипты, отладка), создается контейнер по умолчанию."""
+    global _container
+    if _container is None:
+        _container = AppContainer()
+    return _container
@@ -0,0 +1,119 @@
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, Optional
+
+
+class AdmissionRejected(Exception):
+    """У пользователя уже слишком много запросов в работе и в очереди."""
+
+
+class FairScheduler:
+    """
+    Ограничивает число одновременно выполняемых тяжелых операций (скачивание
+    голосовых, Whisper, разбор через LLM) глобально и на одного пользователя.
+
+    Запросы, которым не хватило слота, ждут в очереди своего ключа. Освободившиеся
+    слоты раздаются по ключам взвешенным round-robin: за один проход ключ с весом
+    w получает до w слотов, поэтому один пользователь с сотней запросов не
+    отодвигает остальных в конец общей очереди. Вес умножает и лимит ключа:
+    ключ с весом w может держать до per_key_limit * w слотов одновременно, иначе
+    при per_key_limit = 1 вес ни на что бы не влиял.
+    """
+    def __init__(self, global_limit: int, per_key_limit: int, max_queued_per_key: int,
+                 weights: Optional[Dict[Hashable, int]] = None):
+        self.global_limit = max(1, global_limit)
+        self.per_key_limit = max(1, per_key_limit)
+        self.max_queued_per_key = max(0, max_queued_per_key)
+        self.weights = weights or {}
+        self.active = 0
+        self._active_by_key: Dict[Hashable, int] = {}
+        self._waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        self._credits: Dict[Hashable, int] = {}
+        self.metrics: Dict[str, int] = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    def _weight(self, key: Hashable) -> int:
+        return max(1, self.weights.get(key, 1))
+
+    def _key_limit(self, key: Hashable) -> int:
+        return self.per_key_limit * self._weight(key)
+
+    def queued(self, key: Hashable) -> int:
+        return len(self._waiters.get(key, ()))
+
+    def can_start_now(self, key: Hashable) -> bool:
+        # После каждого _dispatch в очереди остаются только те, кому слот выдать нельзя,
+        # поэтому свободный слот можно сразу отдать новому запросу
+        return (self.active < self.global_limit
+                and self._active_by_key.get(key, 0) < self._key_limit(key))
+
+    def _grant(self, key: Hashable) -> None:
+        self.active += 1
+        self._active_by_key[key] = self._active_by_key.get(key, 0) + 1
+
+    def _release(self, key: Hashable) -> None:
+        self.active -= 1
+        self._active_by_key[key] -= 1
+        if not self._active_by_key[key]:
+            del self._active_by_key[key]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Раздает свободные слоты ожидающим ключам по взвешенному round-robin."""
+        while self.active < self.global_limit and self._waiters:
+            granted = False
+            for key in list(self._waiters):
+                if self.active >= self.global_limit:
+                    break
+                queue = self._waiters[key]
+                if self._active_by_key.get(key, 0) >= self._key_limit(key):
+                    continue
+                future = queue.popleft()
+                if not future.done():
+                    self._grant(key)
+                    future.set_result(None)
+                    granted = True
+                    self._credits[key] = self._credits.get(key, self._weight(key)) - 1
+                if not queue:
+                    del self._waiters[key]
+                    self._credits.pop(key, None)
+                elif self._credits.get(key, 0) <= 0:
+                    # Ключ исчерпал свою долю на этом проходе — в конец очереди
+                    self._credits[key] = self._weight(key)
+                    self._waiters.move_to_end(key)
+                    break
+            if not granted:
+                break
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable):
+        """Занимает слот на время блока; бросает AdmissionRejected, если очередь ключа переполнена."""
+        if self.can_start_now(key):
+            self._grant(key)
+            self.metrics["admitted"] += 1
+        else:
+            if self.queued(key) >= self.max_queued_per_key:
+                self.metrics["rejected"] += 1
+                raise AdmissionRejected(key)
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(key, deque()).append(future)
+            self.metrics["queued"] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Слот уже выдан, но ожидающий отменен — возвращаем слот
+                    self._release(key)
+                else:
+                    queue = self._waiters.get(key)
+                    if queue is not None and future in queue:
+                        queue.remove(future)
+                        if not queue:
+                            del self._waiters[key]
+                            self._credits.pop(key, None)
+                raise
+            self.metrics["admitted"] += 1
+        try:
+            yield
+        finally:
+            self._release(key)
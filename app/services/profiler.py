@@ -0,0 +1,206 @@
+import asyncio
+import hmac
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+DEFAULT_TOP_N = 25
+
+_profile_lock = asyncio.Lock()
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер для всего процесса.
+
+    Фоновый поток раз в `interval` секунд снимает стеки всех потоков через
+    sys._current_frames() и считает одинаковые стеки. Пока профайлер не запущен,
+    никакого потока и хуков нет, так что в обычном режиме он ничего не стоит.
+
+    Сэмплер — обычный Python-поток, поэтому результаты смещены GIL: поток
+    получает GIL в основном тогда, когда event loop его отпускает, то есть в
+    select(). CPU-bound код в корутинах получает заметно меньше сэмплов, чем
+    реально тратит времени, а select — больше. Долю select стоит читать как
+    верхнюю оценку простоя, а не как точное значение.
+    """
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._root = os.getcwd()
+
+    def _frame_label(self, frame) -> str:
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(self._root):
+            filename = os.path.relpath(filename, self._root)
+        else:
+            filename = os.path.basename(filename)
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+    def _sample(self) -> None:
+        own_thread_id = threading.get_ident()
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            self._sample()
+            self._stop_event.wait(self.interval)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """Стеки в формате collapsed stacks (flamegraph.pl, speedscope, inferno)."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self, top_n: int = DEFAULT_TOP_N) -> str:
+        """Топ функций по собственному (self) и суммарному (total) числу сэмплов."""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # первый элемент — имя потока
+            if not frames:
+                continue
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+
+        total = sum(self.stacks.values()) or 1
+        lines = [f"Samples: {self.samples}, stacks: {sum(self.stacks.values())}, interval: {self.interval * 1000:.1f} ms", ""]
+        lines.append("Top by self time:")
+        for frame, count in self_counts.most_common(top_n):
+            lines.append(f"{count / total * 100:6.2f}% {count:8d}  {frame}")
+        lines.append("")
+        lines.append("Top by total time:")
+        for frame, count in total_counts.most_common(top_n):
+            lines.append(f"{count / total * 100:6.2f}% {count:8d}  {frame}")
+        return "\n".join(lines) + "\n"
+
+
+def _await_chain(coro) -> List[str]:
+    """Разворачивает цепочку await'ов корутины до того объекта, которого она ждет."""
+    chain = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        name = getattr(coro, "__qualname__", None)
+        if name is None:
+            chain.append(repr(coro))
+            break
+        location = f" ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})" if frame is not None else ""
+        chain.append(f"{name}{location}")
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return chain
+
+
+def dump_asyncio_tasks() -> str:
+    """Текстовый дамп всех незавершенных asyncio-задач и того, что каждая из них ждет."""
+    try:
+        tasks = asyncio.all_tasks()
+    except RuntimeError:
+        return "No running event loop.\n"
+
+    lines = [f"Pending tasks: {len(tasks)}", ""]
+    for task in sorted(tasks, key=lambda t: t.get_name()):
+        lines.append(f"Task {task.get_name()}:")
+        for depth, item in enumerate(_await_chain(task.get_coro())):
+            lines.append(f"{'  ' * (depth + 1)}-> {item}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+async def run_profile(seconds: float, interval: float = DEFAULT_SAMPLE_INTERVAL,
+                      top_n: int = DEFAULT_TOP_N) -> Dict[str, Any]:
+    """
+    Профилирует процесс в течение `seconds` секунд, не блокируя event loop.
+    Одновременно может идти только один запуск.
+    """
+    # asyncio.sleep(nan) не просыпается никогда — профайлер и блокировка остались бы занятыми навсегда
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"seconds must be a positive finite number, got {seconds}")
+    if _profile_lock.locked():
+        raise RuntimeError("Profiling is already running.")
+
+    async with _profile_lock:
+        profiler = SamplingProfiler(interval=interval)
+        logging.info(f"Starting sampling profiler for {seconds} s")
+        started_at = time.monotonic()
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+            # Дамп задач снимаем, пока профайлер работает: так видно, что ждут хендлеры под нагрузкой
+            tasks_dump = dump_asyncio_tasks()
+        finally:
+            await asyncio.to_thread(profiler.stop)
+        logging.info(f"Sampling profiler finished: {profiler.samples} samples in {time.monotonic() - started_at:.1f} s")
+
+        return {
+            "samples": profiler.samples,
+            "collapsed": profiler.collapsed(),
+            "summary": profiler.summary(top_n),
+            "tasks": tasks_dump,
+        }
+
+
+def build_profiler_web_app(token: Optional[str], max_seconds: float):
+    """
+    HTTP-эндпоинт GET /debug/profile?seconds=N&format=summary|collapsed|tasks.
+    Требует токен в заголовке `Authorization: Bearer <token>`; без токена
+    эндпоинт не создается. aiohttp.web импортируется только когда эндпоинт включен.
+    """
+    if not token:
+        raise ValueError("Profiler endpoint requires a token")
+
+    from aiohttp import web
+
+    expected_header = f"Bearer {token}"
+
+    async def handle_profile(request: "web.Request") -> "web.Response":
+        if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected_header.encode()):
+            return web.Response(status=401, text="Unauthorized\n")
+        try:
+            seconds = float(request.query.get("seconds", "10"))
+        except ValueError:
+            seconds = math.nan
+        if not math.isfinite(seconds):
+            return web.Response(status=400, text="seconds must be a finite number\n")
+        seconds = min(max(seconds, 0.1), max_seconds)
+        output_format = request.query.get("format", "summary")
+        if output_format not in ("summary", "collapsed", "tasks"):
+            return web.Response(status=400, text="format must be one of: summary, collapsed, tasks\n")
+
+        try:
+            result = await run_profile(seconds)
+        except RuntimeError as e:
+            return web.Response(status=409, text=f"{e}\n")
+        except ValueError as e:
+            return web.Response(status=400, text=f"{e}\n")
+        return web.Response(text=result[output_format])
+
+    app = web.Application()
+    app.router.add_get("/debug/profile", handle_profile)
+    return app
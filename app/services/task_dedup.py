@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.container import get_container
+
+_MASK_64 = (1 << 64) - 1
+_NORMALIZE_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def _normalize(title: str) -> str:
+    return " ".join(_NORMALIZE_RE.sub(" ", title.lower()).split())
+
+
+def _shingles(title: str, ngram: int) -> Set[int]:
+    """Символьные n-граммы нормализованного названия, захешированные crc32."""
+    text = f" {_normalize(title)} "
+    if len(text) <= ngram:
+        return {zlib.crc32(text.encode())}
+    return {zlib.crc32(text[i:i + ngram].encode()) for i in range(len(text) - ngram + 1)}
+
+
+def _jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class TaskSimilarityIndex:
+    """
+    Индекс недавно созданных задач для поиска почти-дубликатов по названию.
+
+    Название разбивается на символьные n-граммы, по ним считается MinHash-подпись
+    из num_perm значений, а подпись режется на bands полос (LSH). Кандидаты —
+    задачи той же области (тенант/проект/доска), совпавшие хотя бы в одной
+    полосе; кандидаты перепроверяются точным коэффициентом Жаккара. Так поиск не
+    зависит от общего размера истории.
+
+    Пара попадает в кандидаты с вероятностью 1 - (1 - J^rows)^bands, порог LSH
+    примерно (1/bands)^(1/rows). При 16 полосах по 2 строки он около 0.25 —
+    заметно ниже порога похожести 0.6, поэтому пары у самого порога не теряются
+    (при 8 x 4 порог LSH совпадал с ним, и треть таких пар не находилась).
+
+    Индекс ограничен по числу записей и по возрасту: старые записи вытесняются
+    первыми. Состояние сохраняется в JSON, чтобы переживать перезапуски. Из
+    хендлеров файл читается и пишется в отдельном потоке (ensure_loaded,
+    save_if_needed), чтобы не блокировать event loop.
+    """
+    def __init__(self, path: Optional[str] = None, max_items: int = 10_000, ttl_seconds: float = 30 * 24 * 3600,
+                 threshold: float = 0.6, num_perm: int = 32, bands: int = 16, ngram: int = 3,
+                 autosave_every: int = 20):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.path = path
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        self.autosave_every = autosave_every
+        # Хеш-функции multiply-shift (a * x + b) mod 2^64 >> 32 с детерминированными
+        # параметрами: подписи из файла остаются валидными после рестарта
+        self._perms: List[Tuple[int, int]] = [
+            ((zlib.crc32(f"a{i}".encode()) << 32 | zlib.crc32(f"c{i}".encode())) | 1, zlib.crc32(f"b{i}".encode()) << 32)
+            for i in range(num_perm)
+        ]
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+        self._unsaved = 0
+        self._loaded = path is None
+        self._loading: Optional[asyncio.Future] = None
+        self._saving = False
+        self.logger = logging.getLogger(__name__)
+
+    def _signature(self, shingles: Set[int]) -> List[int]:
+        # Сдвиг монотонен, поэтому его можно применить к минимуму, а не к каждому значению
+        values = list(shingles)
+        return [min([(a * x + b) & _MASK_64 for x in values]) >> 32 for a, b in self._perms]
+
+    def _band_keys(self, scope: str, signature: List[int]):
+        for band in range(self.bands):
+            yield scope, band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def _insert(self, entry: Dict[str, Any]) -> None:
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        for key in self._band_keys(entry["scope"], entry["signature"]):
+            self._buckets.setdefault(key, set()).add(entry_id)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        for key in self._band_keys(entry["scope"], entry["signature"]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _evict(self, now: float) -> None:
+        # Записи лежат в порядке создания, поэтому и по возрасту, и по количеству вытесняем с начала
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_items or now - entry["created_at"] > self.ttl_seconds:
+                self._remove(entry_id)
+            else:
+                break
+
+    def _ensure_loaded(self) -> None:
+        # Синхронная загрузка для скриптов и бенчмарков; хендлеры заранее вызывают ensure_loaded()
+        if not self._loaded:
+            self._loaded = True
+            self.load()
+
+    async def ensure_loaded(self) -> None:
+        """Загружает индекс с диска в отдельном потоке; одновременные вызовы ждут одну загрузку."""
+        if self._loaded:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self.load))
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            # Неудачная загрузка не должна запоминаться навсегда: следующий вызов попробует снова
+            self._loading = None
+            raise
+        self._loaded = True
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._entries)
+
+    def add(self, scope: str, title: str, task_id: Any = None, url: Optional[str] = None,
+            created_at: Optional[float] = None) -> None:
+        """Добавляет созданную задачу в индекс."""
+        self._ensure_loaded()
+        now = time.time()
+        self._insert({
+            "scope": scope,
+            "title": title,
+            "task_id": task_id,
+            "url": url,
+            "created_at": created_at if created_at is not None else now,
+            "signature": self._signature(_shingles(title, self.ngram)),
+        })
+        self._evict(now)
+        self._unsaved += 1
+
+    def find_similar(self, scope: str, title: str, limit: int = 3) -> List[Dict[str, Any]]:
+        """Возвращает до `limit` похожих задач из той же области, самые похожие первыми."""
+        self._ensure_loaded()
+        now = time.time()
+        self._evict(now)
+        shingles = _shingles(title, self.ngram)
+        candidates: Set[int] = set()
+        for key in self._band_keys(scope, self._signature(shingles)):
+            candidates.update(self._buckets.get(key, ()))
+
+        matches = []
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            similarity = _jaccard(shingles, _shingles(entry["title"], self.ngram))
+            if similarity >= self.threshold:
+                matches.append({
+                    "title": entry["title"],
+                    "task_id": entry["task_id"],
+                    "url": entry["url"],
+                    "similarity": similarity,
+                })
+        matches.sort(key=lambda m: m["similarity"], reverse=True)
+        return matches[:limit]
+
+    def _write(self, entries: List[Dict[str, Any]]) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"num_perm": self.num_perm, "ngram": self.ngram, "entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def save(self) -> None:
+        # Незагруженный индекс не сохраняем, иначе он затрет файл пустым списком
+        if not self.path or not self._loaded:
+            return
+        self._write(list(self._entries.values()))
+        self._unsaved = 0
+
+    async def save_if_needed(self) -> None:
+        """Сохраняет индекс в отдельном потоке, если с прошлого сохранения добавилось autosave_every задач."""
+        if (not self.path or not self._loaded or self._saving
+                or not self.autosave_every or self._unsaved < self.autosave_every):
+            return
+        # Записи после вставки не меняются, поэтому достаточно снимка списка
+        entries = list(self._entries.values())
+        unsaved = self._unsaved
+        self._saving = True
+        try:
+            await asyncio.to_thread(self._write, entries)
+            self._unsaved -= unsaved
+        except OSError as e:
+            self.logger.error(f"Failed to save similarity index to {self.path}: {e}")
+        finally:
+            self._saving = False
+
+    def _valid_entry(self, entry: Any, same_params: bool) -> bool:
+        if not isinstance(entry, dict):
+            return False
+        if not isinstance(entry.get("scope"), str) or not isinstance(entry.get("title"), str):
+            return False
+        if not isinstance(entry.get("created_at"), (int, float)) or isinstance(entry["created_at"], bool):
+            return False
+        if entry.get("url") is not None and not isinstance(entry["url"], str):
+            return False
+        if not same_params:
+            return True
+        signature = entry.get("signature")
+        return (isinstance(signature, list) and len(signature) == self.num_perm
+                and all(isinstance(value, int) and not isinstance(value, bool) for value in signature))
+
+    def load(self) -> None:
+        """Читает индекс из файла; испорченный файл или записи пропускаются с ошибкой в логе."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            self.logger.error(f"Failed to load similarity index from {self.path}: {e}")
+            return
+        if not isinstance(state, dict) or not isinstance(state.get("entries", []), list):
+            self.logger.error(f"Failed to load similarity index from {self.path}: unexpected file structure")
+            return
+
+        same_params = state.get("num_perm") == self.num_perm and state.get("ngram") == self.ngram
+        skipped = 0
+        for entry in state.get("entries", []):
+            if not self._valid_entry(entry, same_params):
+                skipped += 1
+                continue
+            entry = {
+                "scope": entry["scope"],
+                "title": entry["title"],
+                "task_id": entry.get("task_id"),
+                "url": entry.get("url"),
+                "created_at": entry["created_at"],
+                "signature": entry["signature"] if same_params else self._signature(_shingles(entry["title"], self.ngram)),
+            }
+            self._insert(entry)
+        if skipped:
+            self.logger.error(f"Skipped {skipped} malformed entries in similarity index {self.path}")
+        self._evict(time.time())
+        self.logger.info(f"Loaded {len(self._entries)} tasks into similarity index from {self.path}")
+
+def get_similarity_index() -> TaskSimilarityIndex:
+    return get_container().similarity_index
+
+
+def dedup_scope(tenant: str, project_id: Any, board_id: Any) -> str:
+    return f"{tenant}:{project_id}:{board_id}"
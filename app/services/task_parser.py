@@ -1,54 +1,227 @@
 import json
+import logging
+import time
 from datetime import datetime
-from openai import OpenAI
-from app.config import OPENAI_API_KEY
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+from app.container import get_container
 
-async def parse_task_text(text: str) -> dict:
+TASK_FIELDS = ("title", "deadline", "assignee", "project_name", "board_name")
+
+# Строгая схема ответа: модель обязана вернуть ровно эти пять полей, строку или null
+TASK_SCHEMA = {
+    "name": "task",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {field: {"type": ["string", "null"]} for field in TASK_FIELDS},
+        "required": list(TASK_FIELDS),
+        "additionalProperties": False,
+    },
+}
+
+SYSTEM_PROMPT = (
+    "Извлеки поля задачи из текста пользователя. "
+    "title — краткое название; deadline — дата в формате DD.MM.YYYY; "
+    "assignee — имя или username ответственного; project_name и board_name — названия проекта и доски. "
+    "Если данных нет — null."
+)
+
+PARSER_METRICS: Dict[str, float] = {
+    "requests": 0,
+    "failures": 0,
+    "partial": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "first_field_seconds_total": 0.0,
+    "first_field_samples": 0,
+    "total_seconds_total": 0.0,
+}
+
+
+def get_async_openai_client():
+    """Клиент OpenAI создается (и openai импортируется) при первом обращении."""
+    return get_container().async_openai_client
+
+
+def get_parser_metrics() -> Dict[str, float]:
+    """Счетчики парсера плюс производные значения: средние задержки и доля неудачных разборов."""
+    metrics = dict(PARSER_METRICS)
+    requests = metrics["requests"] or 1
+    metrics["failure_rate"] = metrics["failures"] / requests
+    metrics["avg_first_field_seconds"] = metrics["first_field_seconds_total"] / (metrics["first_field_samples"] or 1)
+    metrics["avg_total_seconds"] = metrics["total_seconds_total"] / requests
+    return metrics
+
+
+class IncrementalJSONReader:
     """
-    Анализирует текст задачи с помощью OpenAI и извлекает структурированные данные.
+    Терпимый потоковый разборщик плоского JSON-объекта.
+
+    feed() принимает очередной кусок текста и возвращает поля, значения которых
+    завершились в этом куске, — не дожидаясь конца ответа. Текст до первой `{`
+    (например, ```json) пропускается, а оборванный на середине ответ не ломает
+    уже прочитанные поля.
     """
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    
-    prompt = f"""
-    Проанализируй следующий текст задачи и извлеки из него следующую информацию, учитывая, что сегодня {current_date}:
-    1. title: Краткое и емкое название задачи.
-    2. deadline: Дата дедлайна, если указана. Приведи к формату DD.MM.YYYY.
-    3. assignee: Имя или username ответственного, если указан.
-    4. project_name: Название проекта, если указано (например, "в проекте 'Название Проекта'").
-    5. board_name: Название доски, если указано (например, "на доске 'Название Доски'").
-
-    Текст задачи: "{text}"
-
-    Ответ верни в формате JSON. Если какая-то информация отсутствует, оставь для нее значение null.
-    Пример ответа:
-    {{
-      "title": "Написать отчет по продажам",
-      "deadline": "31.12.2023",
-      "assignee": "Иван",
-      "project_name": "Мой Проект",
-      "board_name": "Канбан Доска"
-    }}
+    _LITERAL_END = ",}" + " \t\r\n"
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._state = "start"
+        self._token: List[str] = []
+        self._key: Optional[str] = None
+        self._escape = False
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def _emit(self, value: Any, completed: Dict[str, Any]) -> None:
+        if self._key is not None:
+            self.fields[self._key] = value
+            completed[self._key] = value
+        self._key = None
+
+    def _finish_literal(self, completed: Dict[str, Any]) -> None:
+        raw = "".join(self._token)
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        self._emit(value, completed)
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        completed: Dict[str, Any] = {}
+        for char in chunk:
+            state = self._state
+            if state == "start":
+                if char == "{":
+                    self._state = "expect_key"
+            elif state == "expect_key":
+                if char == '"':
+                    self._state = "key"
+                    self._token = []
+                elif char == "}":
+                    self._state = "done"
+            elif state in ("key", "string"):
+                if self._escape:
+                    self._escape = False
+                    self._token.append(char)
+                elif char == "\\":
+                    self._escape = True
+                    self._token.append(char)
+                elif char == '"':
+                    raw = "".join(self._token)
+                    try:
+                        text = json.loads(f'"{raw}"')
+                    except json.JSONDecodeError:
+                        text = raw
+                    if state == "key":
+                        self._key = text
+                        self._state = "colon"
+                    else:
+                        self._emit(text, completed)
+                        self._state = "after_value"
+                else:
+                    self._token.append(char)
+            elif state == "colon":
+                if char == ":":
+                    self._state = "value"
+            elif state == "value":
+                if char == '"':
+                    self._state = "string"
+                    self._token = []
+                elif not char.isspace():
+                    self._state = "literal"
+                    self._token = [char]
+            elif state == "literal":
+                if char in self._LITERAL_END:
+                    self._finish_literal(completed)
+                    self._state = {",": "expect_key", "}": "done"}.get(char, "after_value")
+                else:
+                    self._token.append(char)
+            elif state == "after_value":
+                if char == ",":
+                    self._state = "expect_key"
+                elif char == "}":
+                    self._state = "done"
+        return completed
+
+    def finish(self) -> Dict[str, Any]:
+        """Завершает разбор: дочитывает литерал в конце потока и возвращает все собранные поля."""
+        if self._state == "literal":
+            self._finish_literal({})
+            self._state = "after_value"
+        return self.fields
+
+
+async def parse_task_text(text: str,
+                          on_field: Optional[Callable[[str, Any], Awaitable[None]]] = None) -> dict:
     """
+    Анализирует текст задачи с помощью OpenAI и извлекает структурированные данные.
 
-    response = client.chat.completions.create(
-        model="gpt-5-mini",
-        messages=[
-            {"role": "system", "content": "Ты — ассистент, который помогает парсить текст задачи и возвращает результат в JSON."},
-            {"role": "user", "content": prompt}
-        ],
-    )
+    Ответ стримится и разбирается по мере поступления: как только очередное поле
+    готово, вызывается `on_field(name, value)`. Если ответ оборвался или
+    испорчен, возвращаются поля, которые удалось прочитать.
+    """
+    current_date = datetime.now().strftime("%d.%m.%Y")
+    started_at = time.monotonic()
+    first_field_at = None
+    reader = IncrementalJSONReader()
+    stream_error: Optional[Exception] = None
+    PARSER_METRICS["requests"] += 1
 
     try:
-        parsed_data = json.loads(response.choices[0].message.content)
-        return parsed_data
-    except (json.JSONDecodeError, IndexError):
-        # В случае ошибки парсинга JSON, возвращаем только title и null для остальных полей
-        return {
-            "title": text,
-            "deadline": None,
-            "assignee": None,
-            "project_name": None,
-            "board_name": None
-        }
+        stream = await get_async_openai_client().chat.completions.create(
+            model="gpt-5-mini",
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"Сегодня {current_date}.\n{text}"}
+            ],
+            response_format={"type": "json_schema", "json_schema": TASK_SCHEMA},
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                PARSER_METRICS["prompt_tokens"] += chunk.usage.prompt_tokens
+                PARSER_METRICS["completion_tokens"] += chunk.usage.completion_tokens
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            for name, value in reader.feed(chunk.choices[0].delta.content).items():
+                if name not in TASK_FIELDS:
+                    continue
+                if first_field_at is None:
+                    first_field_at = time.monotonic()
+                    PARSER_METRICS["first_field_seconds_total"] += first_field_at - started_at
+                    PARSER_METRICS["first_field_samples"] += 1
+                if on_field is not None:
+                    try:
+                        await on_field(name, value)
+                    except Exception as e:
+                        # Ошибка в колбэке (например, не отправилось превью) — не повод бросать чтение ответа
+                        logging.warning(f"parse_task_text: on_field({name!r}) failed: {e}", exc_info=True)
+    except Exception as e:
+        # Оборванный поток (таймаут, разрыв соединения) не должен
+        # выбрасывать уже прочитанные поля; без единого поля — это обычная ошибка
+        if not any(field in reader.fields for field in TASK_FIELDS):
+            PARSER_METRICS["failures"] += 1
+            raise
+        stream_error = e
+        logging.warning(f"parse_task_text: stream interrupted, using fields read so far: {e}")
+    finally:
+        PARSER_METRICS["total_seconds_total"] += time.monotonic() - started_at
+
+    fields = reader.finish()
+    parsed_data = {field: fields.get(field) for field in TASK_FIELDS}
+    if not any(field in fields for field in TASK_FIELDS):
+        # Ничего не разобрали: возвращаем только title и null для остальных полей
+        PARSER_METRICS["failures"] += 1
+        logging.warning("parse_task_text: failed to read any field from the model response")
+        parsed_data["title"] = text
+    elif stream_error is not None or not reader.done or len(fields.keys() & set(TASK_FIELDS)) < len(TASK_FIELDS):
+        PARSER_METRICS["partial"] += 1
+        logging.warning(f"parse_task_text: recovered partial response: {parsed_data}")
+        if not parsed_data["title"]:
+            parsed_data["title"] = text
+    return parsed_data
@@ -1,29 +1,134 @@
+import asyncio
 import logging
+import time
+from collections import OrderedDict
 import aiohttp
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, Callable, Tuple
 
-from app.config import WEEEK_API_TOKEN, WEEEK_API_BASE_URL
+from app.config import WEEEK_TASK_URL_TEMPLATE
+from app.container import get_container
 
 BACKLOG_COLUMN_NAME = "Backlog"
+DEFAULT_TENANT = "default"
+
+
+class TenantNotConfigured(LookupError):
+    """Чат не привязан ни к одному тенанту, а тенанта по умолчанию (WEEEK_API_TOKEN) нет."""
+
+
+class TokenBucket:
+    """
+    Простой token bucket: не более `rate` запросов в секунду с запасом `burst`.
+    Если токенов нет, acquire() ждет, а не отклоняет запрос.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Забирает один токен и возвращает время ожидания в секундах."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+def new_client_metrics() -> Dict[str, float]:
+    return {
+        "requests": 0,
+        "errors": 0,
+        "latency_total": 0.0,
+        "rate_limit_wait_total": 0.0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+        "inflight_joins": 0,
+    }
+
 
 class WeeekAPIClient:
-    def __init__(self, base_url: str, token: str):
+    def __init__(self, base_url: str, token: str, tenant: str = DEFAULT_TENANT,
+                 rate_limiter: Optional[TokenBucket] = None, cache_ttl: float = 0,
+                 metrics: Optional[Dict[str, float]] = None):
         self.base_url = base_url
+        self.tenant = tenant
         self.headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
+        self.rate_limiter = rate_limiter
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[Tuple[Any, ...], Tuple[float, Dict[str, Any]]] = {}
+        self._inflight: Dict[Tuple[Any, ...], "asyncio.Future[Dict[str, Any]]"] = {}
+        self.metrics: Dict[str, float] = metrics if metrics is not None else new_client_metrics()
+        self.in_flight = 0
         self.logger = logging.getLogger(__name__)
 
+    async def _cached(self, key: Tuple[Any, ...], fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Возвращает метаданные (участники, проекты, доски) из кэша тенанта, пока не истек TTL."""
+        if self.cache_ttl > 0:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.cache_ttl:
+                self.metrics["cache_hits"] += 1
+                return entry[1]
+        # Одинаковые запросы, пришедшие одновременно (например, предзагрузка и хендлер), ждут один ответ
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.metrics["inflight_joins"] += 1
+            return await asyncio.shield(inflight)
+        self.metrics["cache_misses"] += 1
+        inflight = asyncio.ensure_future(fetch())
+        self._inflight[key] = inflight
+        try:
+            result = await asyncio.shield(inflight)
+        finally:
+            if self._inflight.get(key) is inflight:
+                del self._inflight[key]
+        if self.cache_ttl > 0:
+            self._cache[key] = (time.monotonic(), result)
+        return result
+
+    def invalidate_cache(self) -> None:
+        self._cache.clear()
+
+    @property
+    def idle(self) -> bool:
+        """Нет запросов в работе — клиента можно вытеснить из пула."""
+        return self.in_flight == 0 and not self._inflight
+
     async def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        self.in_flight += 1
+        try:
+            return await self._send(method, path, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    async def _send(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
         url = f"{self.base_url}{path}"
-        self.logger.debug(f"Making {method} request to {url} with data: {kwargs.get('json') or kwargs.get('params')}")
+        self.logger.debug(f"[{self.tenant}] Making {method} request to {url} with data: {kwargs.get('json') or kwargs.get('params')}")
+        if self.rate_limiter is not None:
+            self.metrics["rate_limit_wait_total"] += await self.rate_limiter.acquire()
+        self.metrics["requests"] += 1
+        started_at = time.monotonic()
         async with aiohttp.ClientSession(headers=self.headers) as session:
             try:
                 async with session.request(method, url, **kwargs) as response:
                     response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
                     return await response.json()
             except aiohttp.ClientResponseError as e:
+                self.metrics["errors"] += 1
                 detailed_error_message = f"Weeek API request failed with status {e.status}: {e.message}"
                 try:
                     error_json = await response.json()
@@ -42,8 +147,11 @@ class WeeekAPIClient:
                     headers=e.headers
                 )
             except aiohttp.ClientError as e:
+                self.metrics["errors"] += 1
                 self.logger.error(f"Weeek API request failed: {e}")
                 raise
+            finally:
+                self.metrics["latency_total"] += time.monotonic() - started_at
 
     async def get_workspace_info(self) -> Dict[str, Any]:
         return await self._request("GET", "/ws")
@@ -52,16 +160,22 @@ class WeeekAPIClient:
         """
         Retrieves a list of workspace members.
         """
-        return await self._request("GET", "/ws/members")
+        return await self._cached(("members",), lambda: self._request("GET", "/ws/members"))
 
     async def get_projects(self) -> Dict[str, Any]:
-        return await self._request("GET", "/tm/projects")
+        return await self._cached(("projects",), lambda: self._request("GET", "/tm/projects"))
 
     async def get_boards(self, project_id: int) -> Dict[str, Any]:
-        return await self._request("GET", "/tm/boards", params={"projectId": project_id})
+        return await self._cached(
+            ("boards", project_id),
+            lambda: self._request("GET", "/tm/boards", params={"projectId": project_id})
+        )
 
     async def get_board_columns(self, board_id: int) -> Dict[str, Any]:
-        return await self._request("GET", "/tm/board-columns", params={"boardId": board_id})
+        return await self._cached(
+            ("board_columns", board_id),
+            lambda: self._request("GET", "/tm/board-columns", params={"boardId": board_id})
+        )
 
     async def create_task(self, title: str, description: Optional[str], locations: List[Dict[str, Any]],
                           day: Optional[str] = None, parent_id: Optional[int] = None,
@@ -90,19 +204,116 @@ class WeeekAPIClient:
             
         return await self._request("POST", "/tm/tasks", json=payload)
 
-# Initialize client globally
-_weeek_client = WeeekAPIClient(base_url=WEEEK_API_BASE_URL, token=WEEEK_API_TOKEN)
+
+class WeeekClientPool:
+    """
+    Пул клиентов Weeek по тенантам (рабочим пространствам).
+
+    Чат маршрутизируется в тенант по WEEEK_TENANTS, остальные чаты идут в тенант
+    по умолчанию с WEEEK_API_TOKEN. Если WEEEK_API_TOKEN не задан, для таких
+    чатов бросается TenantNotConfigured, а не создается клиент без токена,
+    который получал бы 401 на каждый запрос. У каждого тенанта свой клиент, свой кэш
+    метаданных, свой лимит запросов и свои метрики. Число одновременно живых
+    клиентов ограничено: при переполнении вытесняется тот, к кому дольше всего
+    не обращались (LRU), но только если у него нет запросов в работе.
+
+    Лимитеры и метрики хранятся в реестре пула, а не в клиенте, и переживают
+    вытеснение: иначе новый клиент получал бы полный bucket и лимит тенанта
+    можно было бы превысить, а метрики обнулялись бы. Реестр ограничен числом
+    настроенных тенантов.
+    """
+    def __init__(self, base_url: str, default_token: Optional[str], tenants: Dict[str, Dict[str, Any]],
+                 max_size: int, rate_limit: float, rate_burst: int, cache_ttl: float):
+        self.base_url = base_url
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.cache_ttl = cache_ttl
+        self.max_size = max(1, max_size)
+        self._tokens: Dict[str, Optional[str]] = {DEFAULT_TENANT: default_token}
+        self._chat_routes: Dict[int, str] = {}
+        for name, tenant in tenants.items():
+            self._tokens[name] = tenant.get("token")
+            for chat_id in tenant.get("chats", []):
+                self._chat_routes[int(chat_id)] = name
+        self._clients: "OrderedDict[str, WeeekAPIClient]" = OrderedDict()
+        self._limiters: Dict[str, TokenBucket] = {}
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self.evictions = 0
+        self.logger = logging.getLogger(__name__)
+
+    def resolve_tenant(self, chat_id: Optional[int]) -> str:
+        tenant = DEFAULT_TENANT if chat_id is None else self._chat_routes.get(int(chat_id), DEFAULT_TENANT)
+        if not self._tokens.get(tenant):
+            raise TenantNotConfigured(chat_id)
+        return tenant
+
+    def get_client(self, chat_id: Optional[int] = None) -> WeeekAPIClient:
+        tenant = self.resolve_tenant(chat_id)
+        client = self._clients.get(tenant)
+        if client is not None:
+            self._clients.move_to_end(tenant)
+            self._evict_idle()
+            return client
+
+        if tenant not in self._limiters:
+            self._limiters[tenant] = TokenBucket(self.rate_limit, self.rate_burst)
+            self._metrics[tenant] = new_client_metrics()
+        client = WeeekAPIClient(
+            base_url=self.base_url,
+            token=self._tokens.get(tenant),
+            tenant=tenant,
+            rate_limiter=self._limiters[tenant],
+            cache_ttl=self.cache_ttl,
+            metrics=self._metrics[tenant],
+        )
+        self._clients[tenant] = client
+        self._evict_idle()
+        return client
+
+    def _evict_idle(self) -> None:
+        # Вытесняем самых давних простаивающих; занятые клиенты остаются, даже если пул временно переполнен
+        for tenant in list(self._clients):
+            if len(self._clients) <= self.max_size:
+                return
+            client = self._clients[tenant]
+            if tenant == next(reversed(self._clients)) or not client.idle:
+                continue
+            del self._clients[tenant]
+            self.evictions += 1
+            self.logger.info(f"Evicted idle Weeek tenant '{tenant}' from client pool")
+
+    def get_metrics(self) -> Dict[str, Dict[str, float]]:
+        """Метрики по всем тенантам, к которым были запросы, включая вытесненные из пула."""
+        return {tenant: dict(metrics) for tenant, metrics in self._metrics.items()}
+
+
+def get_weeek_client(chat_id: Optional[int] = None) -> WeeekAPIClient:
+    """Возвращает клиента Weeek для рабочего пространства, к которому привязан чат."""
+    return get_container().weeek_pool.get_client(chat_id)
+
+
+def get_weeek_pool_metrics() -> Dict[str, Dict[str, float]]:
+    return get_container().weeek_pool.get_metrics()
+
+
+def build_task_url(task_id: Any) -> Optional[str]:
+    """Ссылка на задачу в веб-интерфейсе Weeek, если задан WEEEK_TASK_URL_TEMPLATE."""
+    if not WEEEK_TASK_URL_TEMPLATE or task_id is None:
+        return None
+    return WEEEK_TASK_URL_TEMPLATE.format(task_id=task_id)
 
 
 async def create_weeek_task(title: str, description: Optional[str] = None,
                             deadline: Optional[str] = None, assignee_id: Optional[str] = None,
                             project_id: int = None,
-                            board_id: int = None) -> Dict[str, Any]:
+                            board_id: int = None,
+                            chat_id: Optional[int] = None) -> Dict[str, Any]:
     """
     Эта функция будет отправлять запрос к Weeek API для создания задачи.
-    Принимает конкретные ID проекта и доски.
+    Принимает конкретные ID проекта и доски; chat_id определяет рабочее пространство.
     """
-    logging.info(f"Attempting to create task in Weeek:")
+    weeek_client = get_weeek_client(chat_id)
+    logging.info(f"Attempting to create task in Weeek (tenant: {weeek_client.tenant}):")
     logging.info(f"  Title: {title}")
     if description:
         logging.info(f"  Description: {description}")
@@ -120,7 +331,7 @@ async def create_weeek_task(title: str, description: Optional[str] = None,
             return {"status": "error", "message": "Project ID and Board ID must be provided."}
 
         # 1. Get board columns for the selected board
-        columns_response = await _weeek_client.get_board_columns(board_id=board_id)
+        columns_response = await weeek_client.get_board_columns(board_id=board_id)
         columns = columns_response.get("boardColumns", [])
 
         if not columns:
@@ -149,7 +360,7 @@ async def create_weeek_task(title: str, description: Optional[str] = None,
         ]
 
         # 4. Create the task
-        response = await _weeek_client.create_task(
+        response = await weeek_client.create_task(
             title=title,
             description=description,
             locations=locations_payload,
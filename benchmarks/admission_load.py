@@ -0,0 +1,91 @@
+"""
+Нагрузочный сценарий для FairScheduler: один пользователь заваливает бота
+голосовыми, остальные пишут в обычном темпе. Сравнивает задержку обычных
+пользователей (p50/p99) без ограничений и с планировщиком.
+
+Тяжелая операция моделируется через asyncio.sleep: это соответствует боту,
+только пока скачивание, Whisper и LLM вызываются асинхронно и не блокируют
+event loop. Синхронный вызов внутри хендлера остановил бы всех пользователей
+сразу, и никакой планировщик бы не помог.
+
+Запуск: python -m benchmarks.admission_load
+"""
+import asyncio
+import random
+import statistics
+import time
+from typing import List, Optional
+
+from app.services.admission import AdmissionRejected, FairScheduler
+
+ABUSER_ID = 0
+NORMAL_USERS = 20
+NORMAL_REQUESTS_PER_USER = 5
+ABUSER_REQUESTS = 300
+# Сколько тяжелых операций реально выдерживает бэкенд (OpenAI/Weeek) одновременно
+BACKEND_CAPACITY = 8
+WORK_SECONDS = 0.05
+DURATION_SECONDS = 3.0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_scenario(scheduler: Optional[FairScheduler]) -> dict:
+    backend = asyncio.Semaphore(BACKEND_CAPACITY)
+    latencies: List[float] = []
+    rejected = {"abuser": 0, "normal": 0}
+
+    async def expensive_work():
+        # Перегруженный бэкенд обслуживает запросы по очереди, FIFO
+        async with backend:
+            await asyncio.sleep(WORK_SECONDS * random.uniform(0.5, 1.5))
+
+    async def request(user_id: int):
+        started_at = time.monotonic()
+        try:
+            if scheduler is None:
+                await expensive_work()
+            else:
+                async with scheduler.slot(user_id):
+                    await expensive_work()
+        except AdmissionRejected:
+            rejected["abuser" if user_id == ABUSER_ID else "normal"] += 1
+            return
+        if user_id != ABUSER_ID:
+            latencies.append(time.monotonic() - started_at)
+
+    async def abuser():
+        await asyncio.gather(*(request(ABUSER_ID) for _ in range(ABUSER_REQUESTS)))
+
+    async def normal_user(user_id: int):
+        tasks = []
+        for _ in range(NORMAL_REQUESTS_PER_USER):
+            await asyncio.sleep(random.uniform(0, DURATION_SECONDS / NORMAL_REQUESTS_PER_USER))
+            tasks.append(asyncio.create_task(request(user_id)))
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(abuser(), *(normal_user(user_id) for user_id in range(1, NORMAL_USERS + 1)))
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rejected": rejected,
+    }
+
+
+async def main() -> None:
+    random.seed(42)
+    baseline = await run_scenario(None)
+    random.seed(42)
+    fair = await run_scenario(FairScheduler(global_limit=BACKEND_CAPACITY, per_key_limit=1, max_queued_per_key=2))
+
+    for name, result in (("no admission control", baseline), ("fair scheduler", fair)):
+        print(f"{name:>20}: normal users p50={result['p50_ms']:.0f} ms p99={result['p99_ms']:.0f} ms, "
+              f"rejected abuser={result['rejected']['abuser']} normal={result['rejected']['normal']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""
+Бенчмарк холодного старта бота.
+
+1. `python -X importtime -c "import main"`: суммарное время импорта и самые
+   дорогие модули (по cumulative).
+2. Время от запуска интерпретатора до первого обработанного апдейта: дочерний
+   процесс импортирует main, собирает диспетчер и прогоняет через него /help.
+   Запросы к Telegram уходят в сессию-заглушку, поэтому сеть не нужна.
+
+Запуск: python -m benchmarks.cold_start [--runs N]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+TOP_N = 15
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+_BENCH_ENV = {
+    "TELEGRAM_BOT_TOKEN": "123456:BENCHMARK-TOKEN",
+    "OPENAI_API_KEY": "sk-benchmark",
+    "WEEEK_API_TOKEN": "benchmark",
+    "DEDUP_INDEX_PATH": "",
+}
+
+
+def measure_imports() -> None:
+    env = {**os.environ, **_BENCH_ENV}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            capture_output=True, text=True, env=env, check=True)
+    modules = []
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules.append((int(cumulative_us), name))
+        if len(indent) == 1:  # модуль верхнего уровня
+            total_us += int(cumulative_us)
+
+    print(f"import main: {total_us / 1000:.1f} ms total")
+    print(f"heavy modules loaded: openai={'openai' in {n for _, n in modules}}")
+    for cumulative_us, name in sorted(modules, reverse=True)[:TOP_N]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+def child() -> None:
+    """Импортирует бота и обрабатывает один апдейт; печатает READY, когда апдейт обработан."""
+    import asyncio
+    from datetime import datetime
+
+    from aiogram import Bot
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message, Update, User
+
+    import main
+
+    class NullSession(BaseSession):
+        async def make_request(self, bot, method, timeout=None):
+            return None
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self):
+            pass
+
+    async def run():
+        bot = Bot(token=_BENCH_ENV["TELEGRAM_BOT_TOKEN"], session=NullSession())
+        dp = main.create_dispatcher()
+        user = User(id=1, is_bot=False, first_name="Bench")
+        update = Update(update_id=1, message=Message(
+            message_id=1, date=datetime.now(), chat=Chat(id=1, type="private"), from_user=user, text="/help",
+        ))
+        await dp.feed_update(bot, update)
+
+    asyncio.run(run())
+    print("READY", "openai" in sys.modules, flush=True)
+
+
+def measure_first_update(runs: int) -> None:
+    env = {**os.environ, **_BENCH_ENV}
+    timings = []
+    openai_loaded = False
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-m", "benchmarks.cold_start", "--child"],
+                                   stdout=subprocess.PIPE, text=True, env=env)
+        for line in process.stdout:
+            if line.startswith("READY"):
+                timings.append(time.perf_counter() - started_at)
+                openai_loaded = line.split()[1] == "True"
+                break
+        process.wait()
+        if process.returncode:
+            raise SystemExit(f"child process failed with code {process.returncode}")
+
+    print(f"cold start to first processed update: median={statistics.median(timings) * 1000:.0f} ms "
+          f"min={min(timings) * 1000:.0f} ms over {runs} runs (openai imported: {openai_loaded})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+    measure_imports()
+    measure_first_update(args.runs)
+
+
+if __name__ == "__main__":
+    main()
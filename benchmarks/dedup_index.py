@@ -0,0 +1,102 @@
+"""
+Бенчмарк TaskSimilarityIndex на 100k названий: вставка, поиск похожих
+(p50/p99), полнота поиска для пар с похожестью около порога, сохранение и
+загрузка с диска.
+
+Полнота меряется на искаженных копиях сохраненных названий с коэффициентом
+Жаккара в заданном диапазоне: почти одинаковые запросы LSH находит всегда,
+интересны пары у самого порога.
+
+Запуск: python -m benchmarks.dedup_index
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app.services.task_dedup import TaskSimilarityIndex, _jaccard, _shingles
+
+TITLES = 100_000
+QUERIES = 2_000
+SCOPES = 50
+RECALL_RANGES = [(0.60, 0.65), (0.65, 0.70), (0.70, 0.80)]
+
+VERBS = ["Подготовить", "Исправить", "Проверить", "Написать", "Обновить", "Согласовать", "Настроить", "Починить"]
+OBJECTS = ["отчет", "баг", "лендинг", "договор", "презентацию", "интеграцию", "рассылку", "дашборд", "релиз"]
+DETAILS = ["по продажам", "в корзине", "для клиента", "за ноябрь", "на сервере", "в мобильном приложении",
+           "с бухгалтерией", "по оплате", "для партнеров", "после ревью"]
+ALPHABET = "абвгдежзийклмнопрстуфхцчшщыэюя"
+
+
+def make_title(rng: random.Random) -> str:
+    return f"{rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(DETAILS)} #{rng.randint(1, 10**6)}"
+
+
+def make_variant(rng: random.Random, title: str, low: float, high: float, ngram: int) -> str:
+    """Портит буквы в названии, пока похожесть на оригинал не попадет в [low, high)."""
+    original = _shingles(title, ngram)
+    while True:
+        chars = list(title)
+        while True:
+            chars[rng.randrange(len(chars))] = rng.choice(ALPHABET)
+            variant = "".join(chars)
+            similarity = _jaccard(original, _shingles(variant, ngram))
+            if similarity < high:
+                break
+        if similarity >= low:
+            return variant
+
+
+def main() -> None:
+    rng = random.Random(42)
+    titles = [(f"scope-{rng.randrange(SCOPES)}", make_title(rng)) for _ in range(TITLES)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "index.json")
+        index = TaskSimilarityIndex(path=path, max_items=TITLES, autosave_every=0)
+
+        started_at = time.perf_counter()
+        for task_id, (scope, title) in enumerate(titles):
+            index.add(scope, title, task_id=task_id)
+        insert_seconds = time.perf_counter() - started_at
+
+        latencies = []
+        for _ in range(QUERIES):
+            scope, title = rng.choice(titles)
+            started_at = time.perf_counter()
+            index.find_similar(scope, make_title(rng))
+            latencies.append(time.perf_counter() - started_at)
+        latencies.sort()
+
+        recall = []
+        for low, high in RECALL_RANGES:
+            hits = 0
+            for _ in range(QUERIES // len(RECALL_RANGES)):
+                task_id = rng.randrange(TITLES)
+                scope, title = titles[task_id]
+                query = make_variant(rng, title, low, high, index.ngram)
+                hits += any(m["task_id"] == task_id for m in index.find_similar(scope, query, limit=TITLES))
+            recall.append(f"J {low:.2f}-{high:.2f}: {hits / (QUERIES // len(RECALL_RANGES)):.1%}")
+
+        started_at = time.perf_counter()
+        index.save()
+        save_seconds = time.perf_counter() - started_at
+
+        restored = TaskSimilarityIndex(path=path, max_items=TITLES)
+        started_at = time.perf_counter()
+        restored_size = len(restored)
+        load_seconds = time.perf_counter() - started_at
+
+        print(f"index: {index.num_perm} hashes in {index.bands} bands x {index.rows} rows, "
+              f"LSH cutoff ~{(1 / index.bands) ** (1 / index.rows):.2f}, threshold {index.threshold}")
+        print(f"insert: {TITLES} titles in {insert_seconds:.1f} s ({insert_seconds / TITLES * 1e6:.0f} us/title)")
+        print(f"lookup: p50={statistics.median(latencies) * 1e3:.2f} ms "
+              f"p99={latencies[int(len(latencies) * 0.99)] * 1e3:.2f} ms")
+        print(f"recall near threshold: {', '.join(recall)}")
+        print(f"save: {save_seconds:.2f} s ({os.path.getsize(path) / 1e6:.1f} MB), "
+              f"load: {load_seconds:.2f} s ({restored_size} titles)")
+
+
+if __name__ == "__main__":
+    main()
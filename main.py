@@ -1,30 +1,98 @@
 import asyncio
 import logging
 import sys
+from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from app.config import TELEGRAM_BOT_TOKEN
-from app.bot.handlers import basic, task
+from app.config import (
+    TELEGRAM_BOT_TOKEN, PROFILER_HTTP_HOST, PROFILER_HTTP_PORT, PROFILER_HTTP_TOKEN, PROFILE_MAX_SECONDS,
+    ADMISSION_GLOBAL_LIMIT, ADMISSION_PER_USER_LIMIT, ADMISSION_MAX_QUEUED_PER_USER, ADMISSION_WEIGHTS,
+    ConfigError,
+)
+from app.container import AppContainer, init_container
+from app.bot.handlers import admin, basic, task
+from app.bot.middlewares.admission import AdmissionMiddleware
+from app.services.admission import FairScheduler
+
+
+async def start_profiler_http_server():
+    """Поднимает HTTP-эндпоинт профилирования, если задан PROFILER_HTTP_PORT."""
+    if not PROFILER_HTTP_PORT:
+        return None
+
+    from aiohttp import web
+    from app.services.profiler import build_profiler_web_app
+
+    runner = web.AppRunner(build_profiler_web_app(PROFILER_HTTP_TOKEN, PROFILE_MAX_SECONDS))
+    await runner.setup()
+    await web.TCPSite(runner, PROFILER_HTTP_HOST, PROFILER_HTTP_PORT).start()
+    logging.info(f"Profiler endpoint listening on http://{PROFILER_HTTP_HOST}:{PROFILER_HTTP_PORT}/debug/profile")
+    return runner
+
+
+_dispatcher: Optional[Dispatcher] = None
+
+
+def create_dispatcher() -> Dispatcher:
+    """
+    Собирает диспетчер с роутерами и middleware. Роутеры — глобальные объекты модулей
+    и подключаются только к одному диспетчеру, поэтому повторный вызов возвращает уже
+    собранный диспетчер, а не навешивает middleware второй раз.
+    """
+    global _dispatcher
+    if _dispatcher is not None:
+        return _dispatcher
 
-async def main() -> None:
     storage = MemoryStorage()
-    
-    default_properties = DefaultBotProperties(parse_mode=ParseMode.HTML)
-    bot = Bot(token=TELEGRAM_BOT_TOKEN, default=default_properties)
-    
+
     # Передаем storage в диспетчер
     dp = Dispatcher(storage=storage)
     
+    # admin должен идти раньше task: там catch-all обработчик текста
+    dp.include_router(admin.router)
     dp.include_router(basic.router)
     dp.include_router(task.router)
-    
+
+    # Тяжелые хендлеры (флаг expensive) выполняются через общий справедливый планировщик
+    scheduler = FairScheduler(
+        global_limit=ADMISSION_GLOBAL_LIMIT,
+        per_key_limit=ADMISSION_PER_USER_LIMIT,
+        max_queued_per_key=ADMISSION_MAX_QUEUED_PER_USER,
+        weights=ADMISSION_WEIGHTS,
+    )
+    task.router.message.middleware(AdmissionMiddleware(scheduler))
+    _dispatcher = dp
+    return dp
+
+
+async def main() -> None:
+    # Проверяем конфигурацию до запуска: без токенов бот не должен стартовать
+    container = AppContainer()
+    try:
+        container.validate()
+    except ConfigError as e:
+        logging.error(f"Invalid configuration: {e}")
+        sys.exit(1)
+    init_container(container)
+
+    default_properties = DefaultBotProperties(parse_mode=ParseMode.HTML)
+    bot = Bot(token=TELEGRAM_BOT_TOKEN, default=default_properties)
+    dp = create_dispatcher()
+
+    profiler_runner = await start_profiler_http_server()
+
     # Удаляем все вебхуки и запускаем polling
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        container.shutdown()
+        if profiler_runner is not None:
+            await profiler_runner.cleanup()
 
 
 if __name__ == "__main__":